@@ -5,19 +5,34 @@ E-24 Schedule Bot - Complete implementation
 """
 
 import os
+import atexit
+import bisect
+import hashlib
+import heapq
+import itertools
 import logging
-import requests
-import json
+import queue
+import re
 import sqlite3
+import threading
 import time as time_module
-from datetime import datetime, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional
-import pytz
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from flask import Flask, jsonify, render_template_string, request
+from zoneinfo import ZoneInfo
+import httpx
+import orjson
+from flask import Flask, jsonify, make_response, request
+from flask.json.provider import JSONProvider
+from flask_compress import Compress
+from markupsafe import Markup
 from dotenv import load_dotenv
-from schedule_data import SCHEDULE, WEEKDAYS, WEEKDAYS_UA, BREAK_SCHEDULE
+from schedule_data import (
+    SCHEDULE, WEEKDAYS, WEEKDAYS_UA, BREAK_SCHEDULE,
+    PAIR_TIME_STRS, START_MIN, END_MIN
+)
 
 # Load environment variables
 load_dotenv()
@@ -29,6 +44,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# httpx logs every request URL at INFO, and the URL contains the bot token
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
 # Bot configuration
 TOKEN = os.getenv('BOT_TOKEN')
 WEBHOOK_URL = os.getenv('WEBHOOK_URL')
@@ -39,169 +57,455 @@ ANSWER_CALLBACK_URL = f"{BASE_URL}/answerCallbackQuery"
 SET_WEBHOOK_URL = f"{BASE_URL}/setWebhook"
 
 # Ukraine timezone
-UKRAINE_TZ = pytz.timezone('Europe/Kiev')
+UKRAINE_TZ = ZoneInfo('Europe/Kyiv')  # tzdata is pinned, so the current name is always available
+
+# Fixed display formats via %-formatting, which skips strftime's format interpreter
+def format_timestamp(dt) -> str:
+    """Format dt as 'YYYY-MM-DD HH:MM:SS'"""
+    return "%04d-%02d-%02d %02d:%02d:%02d" % (dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second)
+
+def format_hm(dt) -> str:
+    """Format dt as 'HH:MM'"""
+    return "%02d:%02d" % (dt.hour, dt.minute)
+
+def parse_command(text: str) -> str:
+    """'/Schedule@E24Bot args' -> 'schedule'; any whitespace ends the command"""
+    # Leading whitespace means there is no command (split() would skip over it)
+    first = text.split(None, 1)[0] if text and not text[0].isspace() else ''
+    return first.partition('@')[0][1:].lower()
+
+# Pair lookups memoized per (day, minute of day); every handler and endpoint
+# asking within the same minute shares one result
+@lru_cache(maxsize=8)
+def _current_pair_cached(day, current_min):
+    """Pair running at current_min on day, or None"""
+    starts = START_MIN.get(day)
+    if not starts:
+        return None
+    
+    # Last pair that has already started
+    idx = bisect.bisect_right(starts, current_min) - 1
+    if idx >= 0 and current_min < END_MIN[day][idx]:
+        return SCHEDULE[day][idx]
+    
+    return None
+
+@lru_cache(maxsize=8)
+def _next_pair_cached(day, current_min):
+    """First pair on day starting after current_min, or None"""
+    starts = START_MIN.get(day)
+    if not starts:
+        return None
+    
+    # First pair that has not started yet
+    idx = bisect.bisect_right(starts, current_min)
+    if idx < len(starts):
+        return SCHEDULE[day][idx]
+    
+    return None
 
 # Database setup
+DB_PATH = 'bot_database.db'
+
+DB_READERS = 4
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA cache_size=-8000'  # 8 MB page cache per connection
+)
+
+class ConnectionPool:
+    """Long-lived SQLite connections: one writer plus a few readers (autocommit, WAL journal)"""
+    
+    def __init__(self, path, readers=DB_READERS):
+        self.path = path
+        self._writer = self._connect()
+        # WAL allows a single writer at a time
+        self._write_lock = threading.Lock()
+        self._readers = queue.Queue()
+        for _ in range(readers):
+            self._readers.put(self._connect())
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    @contextmanager
+    def write(self):
+        """Exclusive use of the writer connection"""
+        with self._write_lock:
+            yield self._writer
+    
+    @contextmanager
+    def read(self):
+        """Borrow a reader connection; WAL readers don't block the writer"""
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+_db_pool = ConnectionPool(DB_PATH)
+
 def init_db():
     """Initialize SQLite database"""
-    conn = sqlite3.connect('bot_database.db')
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            chat_id INTEGER PRIMARY KEY,
-            username TEXT,
-            first_name TEXT,
-            last_name TEXT,
-            first_interaction TIMESTAMP,
-            last_interaction TIMESTAMP,
-            message_count INTEGER DEFAULT 0
-        )
-    ''')
-    
-    # Create bot_stats table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS bot_stats (
-            id INTEGER PRIMARY KEY,
-            start_time TIMESTAMP,
-            messages_processed INTEGER DEFAULT 0,
-            last_activity TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    with _db_pool.write() as conn:
+        # Create users table
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                chat_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                first_interaction TIMESTAMP,
+                last_interaction TIMESTAMP,
+                message_count INTEGER DEFAULT 0
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_users_last_interaction ON users(last_interaction)')
+        
+        # Create bot_stats table
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS bot_stats (
+                id INTEGER PRIMARY KEY,
+                start_time TIMESTAMP,
+                messages_processed INTEGER DEFAULT 0,
+                last_activity TIMESTAMP
+            )
+        ''')
 
 # Initialize database
 init_db()
 
 # Bot activity tracking
+_start_time = datetime.now(UKRAINE_TZ)
 bot_stats = {
-    'start_time': datetime.now(UKRAINE_TZ),
+    'start_time': _start_time,
     'messages_processed': 0,
-    'active_chats': set(),
-    'last_activity': datetime.now(UKRAINE_TZ)
+    'last_activity': _start_time,
+    'last_activity_str': format_timestamp(_start_time)  # kept in sync with last_activity
 }
 
-def update_user_stats(chat_id, username=None, first_name=None, last_name=None):
-    """Update user statistics in database"""
-    try:
-        conn = sqlite3.connect('bot_database.db')
-        cursor = conn.cursor()
-        
-        # Check if user exists
-        cursor.execute('SELECT message_count FROM users WHERE chat_id = ?', (chat_id,))
-        result = cursor.fetchone()
-        
+# start_time never changes, so its display string is formatted once
+BOT_STATS_START_STR = bot_stats['last_activity_str']
+
+def format_uptime(uptime) -> str:
+    """Format timedelta like str() without microseconds, e.g. '2 days, 3:04:05'"""
+    hours, rem = divmod(uptime.seconds, 3600)
+    minutes, seconds = divmod(rem, 60)
+    hms = f"{hours}:{minutes:02d}:{seconds:02d}"
+    if uptime.days:
+        return f"{uptime.days} day{'s' if abs(uptime.days) != 1 else ''}, {hms}"
+    return hms
+
+# Chats counted as active on the status page and in /stats
+ACTIVE_CHAT_WINDOW = timedelta(hours=1)
+
+def active_chat_threshold(current_time) -> str:
+    """Oldest last_interaction still counted as active, in the stored timestamp format"""
+    # users.last_interaction holds str(datetime) of Kyiv-time values, so the
+    # bound has to be compared in that form (not SQLite's UTC datetime('now'))
+    return str(current_time - ACTIVE_CHAT_WINDOW)
+
+def count_active_chats(current_time) -> int:
+    """Number of chats active within ACTIVE_CHAT_WINDOW (index range scan on last_interaction)"""
+    with _db_pool.read() as conn:
+        return conn.execute(
+            'SELECT COUNT(*) FROM users WHERE last_interaction > ?',
+            (active_chat_threshold(current_time),)
+        ).fetchone()[0]
+
+# User statistics are buffered in memory and written in batches
+USER_STATS_FLUSH_INTERVAL = 5  # seconds
+USER_STATS_FLUSH_SIZE = 100  # buffered messages
+
+_pending_users = {}
+_pending_events = 0
+_pending_lock = threading.Lock()
+_flush_requested = threading.Event()
+
+def update_user_stats(chat_id, username=None, first_name=None, last_name=None, current_time=None):
+    """Buffer user statistics update until the next flush"""
+    global _pending_events
+    if current_time is None:
         current_time = datetime.now(UKRAINE_TZ)
-        
-        if result:
-            # Update existing user
-            cursor.execute('''
-                UPDATE users 
-                SET last_interaction = ?, message_count = message_count + 1,
-                    username = COALESCE(?, username),
-                    first_name = COALESCE(?, first_name),
-                    last_name = COALESCE(?, last_name)
-                WHERE chat_id = ?
-            ''', (current_time, username, first_name, last_name, chat_id))
+
+    with _pending_lock:
+        entry = _pending_users.get(chat_id)
+        if entry is None:
+            _pending_users[chat_id] = {
+                'username': username,
+                'first_name': first_name,
+                'last_name': last_name,
+                'first_interaction': current_time,
+                'last_interaction': current_time,
+                'message_count': 1
+            }
         else:
-            # Insert new user
-            cursor.execute('''
-                INSERT INTO users (chat_id, username, first_name, last_name, 
+            entry['last_interaction'] = current_time
+            entry['message_count'] += 1
+            if username is not None:
+                entry['username'] = username
+            if first_name is not None:
+                entry['first_name'] = first_name
+            if last_name is not None:
+                entry['last_name'] = last_name
+
+        _pending_events += 1
+        if _pending_events >= USER_STATS_FLUSH_SIZE:
+            _flush_requested.set()
+
+def flush_user_stats():
+    """Write buffered user statistics to database"""
+    global _pending_users, _pending_events
+    with _pending_lock:
+        if not _pending_users:
+            return
+        batch = _pending_users
+        _pending_users = {}
+        _pending_events = 0
+
+    rows = [
+        (chat_id, entry['username'], entry['first_name'], entry['last_name'],
+         entry['first_interaction'], entry['last_interaction'], entry['message_count'])
+        for chat_id, entry in batch.items()
+    ]
+
+    try:
+        with _db_pool.write() as conn, conn:
+            conn.execute('BEGIN')
+            conn.executemany('''
+                INSERT INTO users (chat_id, username, first_name, last_name,
                                  first_interaction, last_interaction, message_count)
-                VALUES (?, ?, ?, ?, ?, ?, 1)
-            ''', (chat_id, username, first_name, last_name, current_time, current_time))
-        
-        conn.commit()
-        conn.close()
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(chat_id) DO UPDATE SET
+                    last_interaction = excluded.last_interaction,
+                    message_count = users.message_count + excluded.message_count,
+                    username = COALESCE(excluded.username, users.username),
+                    first_name = COALESCE(excluded.first_name, users.first_name),
+                    last_name = COALESCE(excluded.last_name, users.last_name)
+            ''', rows)
     except Exception as e:
         logger.error(f"Error updating user stats: {e}")
 
+def _user_stats_writer():
+    """Background loop flushing user statistics every few seconds"""
+    while True:
+        _flush_requested.wait(USER_STATS_FLUSH_INTERVAL)
+        _flush_requested.clear()
+        flush_user_stats()
+
+threading.Thread(target=_user_stats_writer, name='user-stats-writer', daemon=True).start()
+atexit.register(flush_user_stats)
+
+# Inline keyboard for schedule navigation; callback data is 'schedule_<day>'
+SCHEDULE_CALLBACK_PREFIX = 'schedule_'
+SCHEDULE_KEYBOARD = {
+    "inline_keyboard": [
+        [
+            {"text": "📅 Понедельник", "callback_data": "schedule_monday"},
+            {"text": "📅 Вторник", "callback_data": "schedule_tuesday"}
+        ],
+        [
+            {"text": "📅 Среда", "callback_data": "schedule_wednesday"},
+            {"text": "📅 Четверг", "callback_data": "schedule_thursday"}
+        ],
+        [
+            {"text": "📅 Пятница", "callback_data": "schedule_friday"},
+            {"text": "📊 Полное расписание", "callback_data": "schedule_full"}
+        ]
+    ]
+}
+
+# /start and /help reply
+HELP_TEXT = """
+
+📚 **Доступные команды:**
+/schedule - Показать полное расписание на неделю
+/current - Какая пара сейчас идет
+/next - Какая следующая пара
+/today - Расписание на сегодня
+/help - Показать это сообщение
+
+        """
+
+# The keyboard is static, so its JSON is encoded once and spliced into payloads
+SCHEDULE_KEYBOARD_JSON = orjson.Fragment(orjson.dumps(SCHEDULE_KEYBOARD))
+
+def serialized_markup(reply_markup):
+    """Swap the schedule keyboard for its pre-encoded JSON; other markups pass through"""
+    return SCHEDULE_KEYBOARD_JSON if reply_markup is SCHEDULE_KEYBOARD else reply_markup
+
+# Rendered command responses for the current minute: (command, day, minute) -> text
+_response_cache = {}
+_response_cache_bucket = None
+
+def get_cached_response(command, day, current_time, build):
+    """Return response text cached for the current minute, building it on a miss"""
+    global _response_cache_bucket
+    bucket = current_time.replace(second=0, microsecond=0)
+    if bucket != _response_cache_bucket:
+        _response_cache.clear()
+        _response_cache_bucket = bucket
+    
+    key = (command, day, current_time.hour * 60 + current_time.minute)
+    result = _response_cache.get(key)
+    if result is None:
+        result = _response_cache[key] = build()
+    return result
+
+# Day-button texts that don't depend on the time (other days, full week): day -> text
+_static_schedule_texts = {}
+
+# Telegram allows about 30 messages per second overall and 1 per second per chat
+TELEGRAM_GLOBAL_RATE = 30
+TELEGRAM_CHAT_RATE = 1
+RATE_LIMIT_MAX_CHATS = 1024  # idle per-chat buckets are pruned past this size
+RATE_LIMIT_MAX_DELAY = 3.0  # seconds of queued sends a bucket may owe; later sends are dropped
+
+class RateLimiter:
+    """Token buckets (global + per chat) that throttle outgoing calls before Telegram does"""
+    
+    def __init__(self, global_rate=TELEGRAM_GLOBAL_RATE, chat_rate=TELEGRAM_CHAT_RATE, per=1.0,
+                 max_delay=RATE_LIMIT_MAX_DELAY):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.per = per
+        self.max_delay = max_delay
+        self._global = [float(global_rate), time_module.monotonic()]
+        self._chats = {}
+        self._lock = threading.Lock()
+    
+    def _refill(self, bucket, rate, now) -> float:
+        """Tokens in bucket at now; negative while earlier sends are still queued"""
+        return min(rate, bucket[0] + (now - bucket[1]) * rate / self.per)
+    
+    def _prune(self, now):
+        """Drop per-chat buckets that have refilled completely"""
+        full = [chat_id for chat_id, bucket in self._chats.items()
+                if self._refill(bucket, self.chat_rate, now) >= self.chat_rate]
+        for chat_id in full:
+            del self._chats[chat_id]
+    
+    def reserve(self, chat_id=None) -> Optional[float]:
+        """Reserve a send; return seconds until it may go out, or None if that exceeds max_delay.
+        
+        chat_id=None only counts against the global bucket. Nothing is taken when
+        the reservation is refused, so dropped sends don't push later ones back.
+        """
+        with self._lock:
+            now = time_module.monotonic()
+            buckets = [(self._global, self.global_rate)]
+            if chat_id is not None:
+                bucket = self._chats.get(chat_id)
+                if bucket is None:
+                    if len(self._chats) >= RATE_LIMIT_MAX_CHATS:
+                        self._prune(now)
+                    bucket = self._chats[chat_id] = [float(self.chat_rate), now]
+                buckets.append((bucket, self.chat_rate))
+            
+            tokens = [self._refill(bucket, rate, now) - 1 for bucket, rate in buckets]
+            wait = max(0.0, *(-left * self.per / rate for left, (_, rate) in zip(tokens, buckets)))
+            if wait > self.max_delay:
+                return None
+            for left, (bucket, _) in zip(tokens, buckets):
+                bucket[0] = left
+                bucket[1] = now
+            return wait
+
+class DelayedCalls:
+    """One timer thread that hands calls to submit once their delay has passed"""
+    
+    def __init__(self, submit):
+        self._submit = submit
+        self._heap = []
+        self._order = itertools.count()  # keeps heap entries with equal deadlines comparable
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, name='delayed-calls', daemon=True).start()
+    
+    def call_later(self, delay, fn, *args):
+        """Run fn(*args) through submit after delay seconds"""
+        with self._cond:
+            heapq.heappush(self._heap, (time_module.monotonic() + delay, next(self._order), fn, args))
+            self._cond.notify()
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    timeout = self._heap[0][0] - time_module.monotonic() if self._heap else None
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                _, _, fn, args = heapq.heappop(self._heap)
+            self._submit(fn, *args)
+
 class ScheduleBot:
     def __init__(self):
-        self.session = self.create_session()
+        self.client = self.create_client()
+        self.rate_limiter = RateLimiter()
+        # Command name (without '/' and '@botname') -> handler
+        self._commands = {
+            'start': self.handle_start,
+            'help': self.handle_start,
+            'schedule': self.handle_schedule,
+            'current': self.handle_current,
+            'next': self.handle_next,
+            'today': self.handle_today
+        }
+        # /schedule depends only on the weekday, so all seven replies are rendered up front
+        self._schedule_texts = {day: self.render_schedule(day) for day in WEEKDAYS}
         self.setup_webhook()
     
-    def create_session(self):
-        """Create requests session with retry strategy"""
-        session = requests.Session()
-        
-        # Define retry strategy
-        retry_strategy = Retry(
-            total=5,  # Total number of retries
-            backoff_factor=1,  # Wait 1, 2, 4, 8, 16 seconds between retries
-            status_forcelist=[429, 500, 502, 503, 504],  # HTTP status codes to retry
-            allowed_methods=["HEAD", "GET", "POST"]  # HTTP methods to retry
+    def create_client(self):
+        """Create shared HTTP/2 client with a persistent connection pool"""
+        # Transport retries failed connection attempts; 5xx responses are
+        # retried by the send/edit/answer loops. The pool covers every update
+        # worker, and idle connections are kept for a minute (httpx default: 5 s)
+        # so the TLS session opened by setWebhook at startup stays warm between bursts
+        transport = httpx.HTTPTransport(
+            http2=True,
+            retries=3,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=32, keepalive_expiry=60)
         )
         
-        # Create adapter with retry strategy
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        
-        # Set timeout for all requests
-        session.timeout = 30
-        
-        # Remove proxy settings to avoid 503 errors
-        session.trust_env = False
-        
-        return session
+        # trust_env=False: ignore proxy settings to avoid 503 errors
+        return httpx.Client(
+            transport=transport,
+            timeout=10.0,
+            trust_env=False,
+            headers={'Content-Type': 'application/json'}
+        )
         
     def get_current_time_ukraine(self) -> datetime:
         """Get current time in Ukraine timezone"""
         return datetime.now(UKRAINE_TZ)
     
-    def get_current_day(self) -> str:
+    def get_current_day(self, current_time: Optional[datetime] = None) -> str:
         """Get current day of week"""
-        current_time = self.get_current_time_ukraine()
-        return WEEKDAYS.get(current_time.weekday(), 'sunday')
-    
-    def parse_time(self, time_str: str) -> tuple:
-        """Parse time string like '8:30-9:50' to start and end time objects"""
-        start_str, end_str = time_str.split('-')
-        start_hour, start_min = map(int, start_str.split(':'))
-        end_hour, end_min = map(int, end_str.split(':'))
-        
-        start_time = time(start_hour, start_min)
-        end_time = time(end_hour, end_min)
-        
-        return start_time, end_time
+        if current_time is None:
+            current_time = self.get_current_time_ukraine()
+        return WEEKDAYS[current_time.weekday()]
     
-    def get_current_pair(self) -> Optional[dict]:
+    def get_current_pair(self, current_time: Optional[datetime] = None) -> Optional[dict]:
         """Get currently active pair"""
-        current_day = self.get_current_day()
-        current_time = self.get_current_time_ukraine().time()
-        
-        if current_day not in SCHEDULE:
-            return None
-            
-        for pair in SCHEDULE[current_day]:
-            start_time, end_time = self.parse_time(pair['time'])
-            if start_time <= current_time <= end_time:
-                return pair
-        
-        return None
+        if current_time is None:
+            current_time = self.get_current_time_ukraine()
+        return _current_pair_cached(WEEKDAYS[current_time.weekday()], current_time.hour * 60 + current_time.minute)
     
-    def get_next_pair(self) -> Optional[dict]:
+    def get_next_pair(self, current_time: Optional[datetime] = None) -> Optional[dict]:
         """Get next upcoming pair"""
-        current_day = self.get_current_day()
-        current_time = self.get_current_time_ukraine().time()
-        
-        if current_day not in SCHEDULE:
-            return None
-            
-        for pair in SCHEDULE[current_day]:
-            start_time, _ = self.parse_time(pair['time'])
-            if current_time < start_time:
-                return pair
-        
-        return None
+        if current_time is None:
+            current_time = self.get_current_time_ukraine()
+        return _next_pair_cached(WEEKDAYS[current_time.weekday()], current_time.hour * 60 + current_time.minute)
     
-    def get_today_schedule(self) -> list:
+    def get_today_schedule(self, current_time: Optional[datetime] = None) -> list:
         """Get today's full schedule"""
-        current_day = self.get_current_day()
+        current_day = self.get_current_day(current_time)
         return SCHEDULE.get(current_day, [])
 
     def setup_webhook(self):
@@ -224,7 +528,7 @@ class ScheduleBot:
             'allowed_updates': ['message', 'callback_query']
         }
         try:
-            response = self.session.post(SET_WEBHOOK_URL, data=webhook_data, timeout=30)
+            response = self.client.post(SET_WEBHOOK_URL, json=webhook_data, timeout=30)
             if response.json().get('ok'):
                 print(f"✅ Webhook set to: {webhook_url}")
             else:
@@ -232,6 +536,77 @@ class ScheduleBot:
         except Exception as e:
             print(f"❌ Error setting webhook: {e}")
     
+    def _post(self, url, data, action, chat_id=None, attempt=0):
+        """POST JSON payload to Telegram API with rate limiting; action describes the call in logs.
+        
+        Throttled sends are queued on delayed_calls instead of sleeping on an update
+        worker; sends that would wait longer than the limiter allows are dropped.
+        """
+        wait = self.rate_limiter.reserve(chat_id)
+        if wait is None:
+            logger.warning(f"Rate limit backlog full, dropping {action}")
+            return None
+        if wait > 0:
+            delayed_calls.call_later(wait, self._send, url, data, action, chat_id, attempt)
+            return None
+        return self._send(url, data, action, chat_id, attempt)
+    
+    def _send(self, url, data, action, chat_id, attempt):
+        """Make one POST attempt; retryable failures are rescheduled through _post after a delay"""
+        max_attempts = 3
+        retry_delay = 2 ** attempt  # Exponential backoff
+        try:
+            response = self.client.post(url, content=orjson.dumps(data))
+            response.raise_for_status()  # Raises an HTTPStatusError for bad responses
+            
+            result = orjson.loads(response.content)
+            if result.get('ok'):
+                return result
+            logger.error(f"Telegram API error {action}: {result}")
+            
+        except httpx.TimeoutException:
+            logger.warning(f"Timeout {action}, attempt {attempt + 1}/{max_attempts}")
+            
+        except httpx.TransportError as e:
+            logger.warning(f"Connection error {action}, attempt {attempt + 1}/{max_attempts}: {e}")
+            
+        except httpx.HTTPStatusError as e:
+            # str(e) contains the request URL and with it the bot token, so log
+            # only the status and Telegram's description
+            status_code = e.response.status_code
+            body = self._error_body(e.response)
+            error = f"{status_code} {e.response.reason_phrase}"
+            if body.get('description'):
+                error += f" - {body['description']}"
+            
+            if status_code == 429:
+                # Flood control: Telegram says how long to back off in parameters.retry_after
+                retry_delay = (body.get('parameters') or {}).get('retry_after') or retry_delay
+                logger.warning(f"Rate limited {action}, retry in {retry_delay}s, attempt {attempt + 1}/{max_attempts}")
+            elif status_code < 500:
+                logger.error(f"HTTP error {action}: {error}")
+                return None  # Don't retry on other 4xx errors
+            else:
+                logger.warning(f"Server error {action}, attempt {attempt + 1}/{max_attempts}: {error}")
+                
+        except Exception as e:
+            logger.error(f"Unexpected error {action}: {e}")
+        
+        if attempt + 1 < max_attempts:
+            delayed_calls.call_later(retry_delay, self._post, url, data, action, chat_id, attempt + 1)
+        else:
+            logger.error(f"Failed {action} after {max_attempts} attempts")
+        return None
+    
+    @staticmethod
+    def _error_body(response) -> dict:
+        """Telegram's JSON error body ('description', 'parameters'), or {} if there is none"""
+        try:
+            body = orjson.loads(response.content)
+        except orjson.JSONDecodeError:
+            return {}
+        return body if isinstance(body, dict) else {}
+    
     def send_message(self, chat_id, text, reply_markup=None):
         """Send message to chat with retry logic"""
         data = {
@@ -241,42 +616,12 @@ class ScheduleBot:
         }
         
         if reply_markup:
-            data['reply_markup'] = json.dumps(reply_markup)
-        
-        max_attempts = 3
-        for attempt in range(max_attempts):
-            try:
-                response = self.session.post(SEND_MESSAGE_URL, data=data, timeout=30)
-                response.raise_for_status()  # Raises an HTTPError for bad responses
-                
-                result = response.json()
-                if result.get('ok'):
-                    logger.info(f"Message sent successfully to {chat_id}")
-                    return result
-                else:
-                    logger.error(f"Telegram API error: {result}")
-                    
-            except requests.exceptions.Timeout:
-                logger.warning(f"Timeout sending message to {chat_id}, attempt {attempt + 1}/{max_attempts}")
-                if attempt < max_attempts - 1:
-                    time_module.sleep(2 ** attempt)  # Exponential backoff
-                    
-            except requests.exceptions.ConnectionError as e:
-                logger.warning(f"Connection error sending message to {chat_id}, attempt {attempt + 1}/{max_attempts}: {e}")
-                if attempt < max_attempts - 1:
-                    time_module.sleep(2 ** attempt)
-                    
-            except requests.exceptions.HTTPError as e:
-                logger.error(f"HTTP error sending message to {chat_id}: {e}")
-                break  # Don't retry on HTTP errors like 4xx
-                
-            except Exception as e:
-                logger.error(f"Unexpected error sending message to {chat_id}: {e}")
-                if attempt < max_attempts - 1:
-                    time_module.sleep(2 ** attempt)
+            data['reply_markup'] = serialized_markup(reply_markup)
         
-        logger.error(f"Failed to send message to {chat_id} after {max_attempts} attempts")
-        return None
+        result = self._post(SEND_MESSAGE_URL, data, f"sending message to {chat_id}", chat_id)
+        if result:
+            logger.info(f"Message sent successfully to {chat_id}")
+        return result
     
     def edit_message(self, chat_id, message_id, text, reply_markup=None):
         """Edit existing message with retry logic"""
@@ -288,41 +633,9 @@ class ScheduleBot:
         }
         
         if reply_markup:
-            data['reply_markup'] = json.dumps(reply_markup)
+            data['reply_markup'] = serialized_markup(reply_markup)
         
-        max_attempts = 3
-        for attempt in range(max_attempts):
-            try:
-                response = self.session.post(EDIT_MESSAGE_URL, data=data, timeout=30)
-                response.raise_for_status()
-                
-                result = response.json()
-                if result.get('ok'):
-                    return result
-                else:
-                    logger.error(f"Telegram API error editing message: {result}")
-                    
-            except requests.exceptions.Timeout:
-                logger.warning(f"Timeout editing message, attempt {attempt + 1}/{max_attempts}")
-                if attempt < max_attempts - 1:
-                    time_module.sleep(2 ** attempt)
-                    
-            except requests.exceptions.ConnectionError as e:
-                logger.warning(f"Connection error editing message, attempt {attempt + 1}/{max_attempts}: {e}")
-                if attempt < max_attempts - 1:
-                    time_module.sleep(2 ** attempt)
-                    
-            except requests.exceptions.HTTPError as e:
-                logger.error(f"HTTP error editing message: {e}")
-                break
-                
-            except Exception as e:
-                logger.error(f"Unexpected error editing message: {e}")
-                if attempt < max_attempts - 1:
-                    time_module.sleep(2 ** attempt)
-        
-        logger.error(f"Failed to edit message after {max_attempts} attempts")
-        return None
+        return self._post(EDIT_MESSAGE_URL, data, "editing message", chat_id)
     
     def answer_callback_query(self, callback_query_id, text=None):
         """Answer callback query with retry logic"""
@@ -330,74 +643,19 @@ class ScheduleBot:
         if text:
             data['text'] = text
         
-        max_attempts = 3
-        for attempt in range(max_attempts):
-            try:
-                response = self.session.post(ANSWER_CALLBACK_URL, data=data, timeout=30)
-                response.raise_for_status()
-                
-                result = response.json()
-                if result.get('ok'):
-                    return result
-                else:
-                    logger.error(f"Telegram API error answering callback: {result}")
-                    
-            except requests.exceptions.Timeout:
-                logger.warning(f"Timeout answering callback, attempt {attempt + 1}/{max_attempts}")
-                if attempt < max_attempts - 1:
-                    time_module.sleep(2 ** attempt)
-                    
-            except requests.exceptions.ConnectionError as e:
-                logger.warning(f"Connection error answering callback, attempt {attempt + 1}/{max_attempts}: {e}")
-                if attempt < max_attempts - 1:
-                    time_module.sleep(2 ** attempt)
-                    
-            except Exception as e:
-                logger.error(f"Unexpected error answering callback: {e}")
-                if attempt < max_attempts - 1:
-                    time_module.sleep(2 ** attempt)
-        
-        logger.error(f"Failed to answer callback query after {max_attempts} attempts")
-        return None
+        return self._post(ANSWER_CALLBACK_URL, data, "answering callback")
     
-    def handle_start(self, chat_id):
+    def handle_start(self, chat_id, current_time=None):
         """Handle /start command"""
-        welcome_text = """
-
-📚 **Доступные команды:**
-/schedule - Показать полное расписание на неделю
-/current - Какая пара сейчас идет
-/next - Какая следующая пара
-/today - Расписание на сегодня
-/help - Показать это сообщение
-
-        """
-        self.send_message(chat_id, welcome_text)
+        self.send_message(chat_id, HELP_TEXT)
     
     def create_schedule_keyboard(self):
         """Create inline keyboard for schedule navigation"""
-        keyboard = {
-            "inline_keyboard": [
-                [
-                    {"text": "📅 Понедельник", "callback_data": "schedule_monday"},
-                    {"text": "📅 Вторник", "callback_data": "schedule_tuesday"}
-                ],
-                [
-                    {"text": "📅 Среда", "callback_data": "schedule_wednesday"},
-                    {"text": "📅 Четверг", "callback_data": "schedule_thursday"}
-                ],
-                [
-                    {"text": "📅 Пятница", "callback_data": "schedule_friday"},
-                    {"text": "📊 Полное расписание", "callback_data": "schedule_full"}
-                ]
-            ]
-        }
-        return keyboard
+        return SCHEDULE_KEYBOARD
     
-    def handle_schedule(self, chat_id, message_id=None):
-        """Handle /schedule command"""
-        current_day = self.get_current_day()
-        today_schedule = self.get_today_schedule()
+    def render_schedule(self, current_day):
+        """Build /schedule response text"""
+        today_schedule = SCHEDULE.get(current_day, [])
         
         if today_schedule:
             result = f"📋 **Расписание на сегодня ({WEEKDAYS_UA[current_day]})**\n\n"
@@ -408,6 +666,13 @@ class ScheduleBot:
             result += f"🎉 Сегодня ({WEEKDAYS_UA[current_day]}) выходной день!\n\n"
             result += "💡 *Выберите день для просмотра расписания:*"
         
+        return result
+    
+    def handle_schedule(self, chat_id, message_id=None, current_time=None):
+        """Handle /schedule command"""
+        if current_time is None:
+            current_time = self.get_current_time_ukraine()
+        result = self._schedule_texts[WEEKDAYS[current_time.weekday()]]
         keyboard = self.create_schedule_keyboard()
         
         if message_id:
@@ -417,46 +682,64 @@ class ScheduleBot:
     
     def handle_schedule_day(self, chat_id, message_id, day):
         """Handle specific day schedule"""
+        current_time = self.get_current_time_ukraine()
+        if SCHEDULE.get(day) and day == WEEKDAYS[current_time.weekday()]:
+            # Today's pair states change during the day
+            result = get_cached_response(
+                'schedule_day', day, current_time,
+                lambda: self.render_schedule_day(day, current_time)
+            )
+        else:
+            result = _static_schedule_texts.get(day)
+            if result is None:
+                result = _static_schedule_texts[day] = self.render_schedule_day(day)
+        
+        keyboard = self.create_schedule_keyboard()
+        self.edit_message(chat_id, message_id, result, keyboard)
+    
+    def render_schedule_day(self, day, current_time=None):
+        """Build text for a day button; current_time marks pair states when day is today"""
+        parts = []
         if day == 'full':
-            result = "📋 **Полное расписание группы E-24 (2 курс, 1 семестр)**\n\n"
-            for day_key, day_name in WEEKDAYS_UA.items():
+            parts.append("📋 **Полное расписание группы E-24 (2 курс, 1 семестр)**\n\n")
+            for day_key in WEEKDAYS_UA:
                 if day_key in SCHEDULE:
-                    result += self.format_schedule_day(day_key, SCHEDULE[day_key]) + "\n\n"
+                    parts.append(self.format_schedule_day(day_key, SCHEDULE[day_key]))
+                    parts.append("\n\n")
         else:
             day_schedule = SCHEDULE.get(day, [])
-            result = f"📅 **Расписание на {WEEKDAYS_UA[day]}**\n\n"
+            parts.append(f"📅 **Расписание на {WEEKDAYS_UA[day]}**\n\n")
             
             if day_schedule:
-                current_day = self.get_current_day()
-                if day == current_day:
-                    current_pair = self.get_current_pair()
-                    current_time = self.get_current_time_ukraine().time()
+                if current_time is not None:
+                    current_min = current_time.hour * 60 + current_time.minute
+                    current_pair = _current_pair_cached(day, current_min)
                     
-                    for pair in day_schedule:
-                        start_time, end_time = self.parse_time(pair['time'])
-                        
-                        if current_pair and pair == current_pair:
+                    for start_min, pair in zip(START_MIN[day], day_schedule):
+                        if pair is current_pair:
                             status = "🔴 "
-                        elif current_time < start_time:
+                        elif current_min < start_min:
                             status = "⏳ "
                         else:
                             status = "✅ "
                         
-                        result += f"{status}{pair['time']} - {pair['subject']}\n"
+                        parts.append(f"{status}{pair['time']} - {pair['subject']}\n")
                 else:
                     for pair in day_schedule:
-                        result += f"🕐 {pair['time']} - {pair['subject']}\n"
+                        parts.append(f"🕐 {pair['time']} - {pair['subject']}\n")
             else:
-                result += "🎉 Выходной день!"
+                parts.append("🎉 Выходной день!")
         
-        result += "\n\n💡 *Выберите другой день:*"
-        keyboard = self.create_schedule_keyboard()
-        self.edit_message(chat_id, message_id, result, keyboard)
+        parts.append("\n\n💡 *Выберите другой день:*")
+        return ''.join(parts)
     
-    def handle_current(self, chat_id):
+    def handle_current(self, chat_id, current_time=None):
         """Handle /current command"""
-        current_pair = self.get_current_pair()
-        current_time = self.get_current_time_ukraine()
+        if current_time is None:
+            current_time = self.get_current_time_ukraine()
+        current_day = WEEKDAYS[current_time.weekday()]
+        current_min = current_time.hour * 60 + current_time.minute
+        current_pair = _current_pair_cached(current_day, current_min)
         
         if current_pair:
             result = f"🔴 **Сейчас идет пара:**\n"
@@ -465,17 +748,17 @@ class ScheduleBot:
             result += f"📊 Пара #{current_pair['pair_number']}"
         else:
             result = f"✅ **Сейчас перерыв или выходной**\n"
-            result += f"🕐 Текущее время: {current_time.strftime('%H:%M')}\n"
+            result += f"🕐 Текущее время: {format_hm(current_time)}\n"
             
-            next_pair = self.get_next_pair()
+            next_pair = _next_pair_cached(current_day, current_min)
             if next_pair:
-                result += f"⏭️ Следующая пара: {next_pair['subject']} в {next_pair['time'].split('-')[0]}"
+                result += f"⏭️ Следующая пара: {next_pair['subject']} в {PAIR_TIME_STRS[next_pair['time']][0]}"
         
         self.send_message(chat_id, result)
     
-    def handle_next(self, chat_id):
+    def handle_next(self, chat_id, current_time=None):
         """Handle /next command"""
-        next_pair = self.get_next_pair()
+        next_pair = self.get_next_pair(current_time)
         
         if next_pair:
             result = f"⏭️ **Следующая пара:**\n"
@@ -487,31 +770,39 @@ class ScheduleBot:
         
         self.send_message(chat_id, result)
     
-    def handle_today(self, chat_id):
-        """Handle /today command"""
-        today_schedule = self.get_today_schedule()
-        current_day = self.get_current_day()
+    def render_today(self, current_time, current_day):
+        """Build /today response text"""
+        today_pairs = SCHEDULE.get(current_day)
         
-        if not today_schedule:
-            result = f"🎉 **Сегодня ({WEEKDAYS_UA[current_day]}) выходной день!**"
-        else:
-            result = f"📅 **Расписание на сегодня ({WEEKDAYS_UA[current_day]}):**\n\n"
-            
-            current_pair = self.get_current_pair()
-            current_time = self.get_current_time_ukraine().time()
+        if not today_pairs:
+            return f"🎉 **Сегодня ({WEEKDAYS_UA[current_day]}) выходной день!**"
+        
+        parts = [f"📅 **Расписание на сегодня ({WEEKDAYS_UA[current_day]}):**\n\n"]
+        
+        current_min = current_time.hour * 60 + current_time.minute
+        current_pair = _current_pair_cached(current_day, current_min)
+        
+        for start_min, pair in zip(START_MIN[current_day], today_pairs):
+            if pair is current_pair:
+                status = "🔴 СЕЙЧАС"
+            elif current_min < start_min:
+                status = "⏳ БУДЕТ"
+            else:
+                status = "✅ БЫЛО"
             
-            for pair in today_schedule:
-                start_time, end_time = self.parse_time(pair['time'])
-                
-                if current_pair and pair == current_pair:
-                    status = "🔴 СЕЙЧАС"
-                elif current_time < start_time:
-                    status = "⏳ БУДЕТ"
-                else:
-                    status = "✅ БЫЛО"
-                
-                result += f"{status} {pair['time']} - {pair['subject']}\n"
+            parts.append(f"{status} {pair['time']} - {pair['subject']}\n")
         
+        return ''.join(parts)
+    
+    def handle_today(self, chat_id, current_time=None):
+        """Handle /today command"""
+        if current_time is None:
+            current_time = self.get_current_time_ukraine()
+        current_day = WEEKDAYS[current_time.weekday()]
+        result = get_cached_response(
+            'today', current_day, current_time,
+            lambda: self.render_today(current_time, current_day)
+        )
         self.send_message(chat_id, result)
     
     def format_schedule_day(self, day, pairs):
@@ -519,19 +810,22 @@ class ScheduleBot:
         if not pairs:
             return f"📅 **{WEEKDAYS_UA[day]}**: Выходной день"
         
-        result = f"📅 **{WEEKDAYS_UA[day]}**:\n"
-        for pair in pairs:
-            result += f"🕐 {pair['time']} - {pair['subject']}\n"
-        
-        return result
+        lines = [f"📅 **{WEEKDAYS_UA[day]}**:\n"]
+        lines.extend(f"🕐 {pair['time']} - {pair['subject']}\n" for pair in pairs)
+        return ''.join(lines)
     
     def handle_message(self, chat_id, text, user_data=None):
         """Handle incoming messages"""
         try:
+            # Only respond to commands starting with /
+            if not text.startswith('/'):
+                return
+            
             # Update statistics
             bot_stats['messages_processed'] += 1
-            bot_stats['active_chats'].add(chat_id)
-            bot_stats['last_activity'] = self.get_current_time_ukraine()
+            current_time = self.get_current_time_ukraine()
+            bot_stats['last_activity'] = current_time
+            bot_stats['last_activity_str'] = format_timestamp(current_time)
             
             # Update user statistics in database
             if user_data:
@@ -539,31 +833,22 @@ class ScheduleBot:
                     chat_id, 
                     user_data.get('username'),
                     user_data.get('first_name'), 
-                    user_data.get('last_name')
+                    user_data.get('last_name'),
+                    current_time
                 )
             else:
-                update_user_stats(chat_id)
-            
-            # Only respond to commands starting with /
-            if not text.startswith('/'):
-                return
+                update_user_stats(chat_id, current_time=current_time)
             
             logger.info(f"Processing command: {text} from chat {chat_id}")
             
-            if text.startswith('/start'):
-                self.handle_start(chat_id)
-            elif text.startswith('/schedule'):
-                self.handle_schedule(chat_id)
-            elif text.startswith('/current'):
-                self.handle_current(chat_id)
-            elif text.startswith('/next'):
-                self.handle_next(chat_id)
-            elif text.startswith('/today'):
-                self.handle_today(chat_id)
-            elif text.startswith('/help'):
-                self.handle_start(chat_id)
-            elif text.startswith('/stats') and str(chat_id) in ['-1002055203579']:  # Admin command
-                self.handle_stats(chat_id)
+            command = parse_command(text)
+            handler = self._commands.get(command)
+            
+            # Handlers reuse the message's timestamp instead of reading the clock again
+            if handler:
+                handler(chat_id, current_time=current_time)
+            elif command == 'stats' and str(chat_id) in ['-1002055203579']:  # Admin command
+                self.handle_stats(chat_id, current_time)
             else:
                 self.send_message(chat_id, "Неизвестная команда. Используйте /help для просмотра доступных команд 📚")
                 
@@ -577,41 +862,46 @@ class ScheduleBot:
     
     def handle_callback_query(self, callback_query):
         """Handle callback query from inline keyboard"""
-        callback_data = callback_query.get('data')
+        callback_data = callback_query.get('data') or ''
         chat_id = callback_query['message']['chat']['id']
         message_id = callback_query['message']['message_id']
         callback_query_id = callback_query['id']
         
-        if callback_data.startswith('schedule_'):
-            day = callback_data.replace('schedule_', '')
-            self.handle_schedule_day(chat_id, message_id, day)
+        if callback_data.startswith(SCHEDULE_CALLBACK_PREFIX):
+            day = callback_data[len(SCHEDULE_CALLBACK_PREFIX):]
+            # Ack first so the button stops spinning before the slower edit
             self.answer_callback_query(callback_query_id)
+            self.handle_schedule_day(chat_id, message_id, day)
         else:
             self.answer_callback_query(callback_query_id, "Неизвестная команда")
     
-    def handle_stats(self, chat_id):
+    def handle_stats(self, chat_id, current_time=None):
         """Handle /stats admin command"""
         try:
-            conn = sqlite3.connect('bot_database.db')
-            cursor = conn.cursor()
-            
-            # Get user count and statistics
-            cursor.execute('SELECT COUNT(*) FROM users')
-            user_count = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT SUM(message_count) FROM users')
-            total_messages = cursor.fetchone()[0] or 0
-            
-            cursor.execute('SELECT COUNT(*) FROM users WHERE last_interaction > datetime("now", "-1 day")')
-            active_today = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM users WHERE last_interaction > datetime("now", "-7 days")')
-            active_week = cursor.fetchone()[0]
+            # Make sure buffered updates are included
+            flush_user_stats()
+
+            if current_time is None:
+                current_time = self.get_current_time_ukraine()
             
-            conn.close()
+            # Get user count and statistics in a single table scan
+            with _db_pool.read() as conn:
+                user_count, total_messages, active_today, active_week, active_chats = conn.execute('''
+                    SELECT COUNT(*),
+                           COALESCE(SUM(message_count), 0),
+                           COALESCE(SUM(last_interaction > ?), 0),
+                           COALESCE(SUM(last_interaction > ?), 0),
+                           COALESCE(SUM(last_interaction > ?), 0)
+                    FROM users
+                ''', (
+                    # Bounds in the stored Kyiv-time str(datetime) form, like active_chat_threshold()
+                    str(current_time - timedelta(days=1)),
+                    str(current_time - timedelta(days=7)),
+                    active_chat_threshold(current_time)
+                )).fetchone()
             
-            current_time = self.get_current_time_ukraine()
             uptime = current_time - bot_stats['start_time']
+            current_time_full = format_timestamp(current_time)
             
             stats_text = f"""📊 **Статистика бота E-24**
 
@@ -623,14 +913,14 @@ class ScheduleBot:
 💬 **Сообщения:**
 • Всего обработано: {total_messages}
 • За эту сессию: {bot_stats['messages_processed']}
-• Активных чатов: {len(bot_stats['active_chats'])}
+• Активных чатов за час: {active_chats}
 
 ⏱️ **Время работы:**
-• Запущен: {bot_stats['start_time'].strftime('%Y-%m-%d %H:%M:%S')}
-• Время работы: {str(uptime).split('.')[0]}
-• Последняя активность: {bot_stats['last_activity'].strftime('%Y-%m-%d %H:%M:%S')}
+• Запущен: {BOT_STATS_START_STR}
+• Время работы: {format_uptime(uptime)}
+• Последняя активность: {bot_stats['last_activity_str']}
 
-🕐 **Текущее время:** {current_time.strftime('%Y-%m-%d %H:%M:%S')}"""
+🕐 **Текущее время:** {current_time_full}"""
             
             self.send_message(chat_id, stats_text)
             
@@ -638,24 +928,72 @@ class ScheduleBot:
             logger.error(f"Error getting stats: {e}")
             self.send_message(chat_id, "Ошибка получения статистики")
 
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson; datetimes are serialized natively as RFC 3339"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping the str round-trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype='application/json')
+
 # Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Compress HTML/JSON responses; bodies are a few KB, so gzip level 6 is still
+# cheap while brotli stays at 4
+COMPRESS_ALGORITHMS = ['br', 'gzip']
+app.config['COMPRESS_ALGORITHM'] = COMPRESS_ALGORITHMS
+app.config['COMPRESS_MIMETYPES'] = ['text/html', 'application/json']
+app.config['COMPRESS_LEVEL'] = 6
+app.config['COMPRESS_BR_LEVEL'] = 4
+Compress(app)
+
+# Indentation, trailing whitespace and blank lines; templates have no <pre>/<textarea>
+_TEMPLATE_WHITESPACE = re.compile(r'\s*\n\s*')
+
+@lru_cache(maxsize=None)
+def _get_template(name):
+    """Load, minify and compile a template once; later renders skip the loader and auto-reload checks"""
+    source, _, _ = app.jinja_env.loader.get_source(app.jinja_env, name)
+    return app.jinja_env.from_string(_TEMPLATE_WHITESPACE.sub('\n', source))
 
 # Bot instance will be initialized later
 schedule_bot = None
 
-# Webhook endpoint
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    """Handle incoming webhook from Telegram"""
+def init_bot():
+    """Create the global bot instance (called once per server process)"""
+    global schedule_bot
+    
+    print(f"🚀 Starting E-24 Schedule Bot")
+    print(f"🤖 Bot token: {TOKEN[:10]}...")
+    
+    # Исправляем двойной слэш в webhook URL
+    webhook_base = WEBHOOK_URL.rstrip('/') if WEBHOOK_URL else ''
+    webhook_full = f"{webhook_base}/webhook"
+    print(f"📡 Webhook URL: {webhook_full}")
+    
+    # Initialize bot after environment variables are confirmed
+    print("🤖 Initializing bot...")
+    schedule_bot = ScheduleBot()
+    print("✅ Bot initialized successfully")
+    return schedule_bot
+
+# Updates are processed off the request thread so Telegram gets 200 right away
+update_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='update')
+# Rate-limited Telegram calls wait here, then run on the same pool
+delayed_calls = DelayedCalls(update_executor.submit)
+
+def process_update(json_data):
+    """Handle a single Telegram update in the background"""
     try:
-        if not schedule_bot:
-            logger.error("Bot not initialized")
-            return 'Bot not ready', 503
-            
-        json_data = request.get_json()
-        
-        if json_data and 'message' in json_data:
+        if 'message' in json_data:
             message = json_data['message']
             chat_id = message['chat']['id']
             
@@ -671,10 +1009,32 @@ def webhook():
                 logger.info(f"Message from {chat_id}: {text}")
                 schedule_bot.handle_message(chat_id, text, user_data)
         
-        elif json_data and 'callback_query' in json_data:
+        elif 'callback_query' in json_data:
             callback_query = json_data['callback_query']
             logger.info(f"Callback query: {callback_query.get('data')}")
-            schedule_bot.handle_callback_query(callback_query)        
+            schedule_bot.handle_callback_query(callback_query)
+    
+    except Exception as e:
+        logger.error(f"Error processing update: {e}")
+
+# Webhook endpoint
+@app.route('/webhook', methods=['POST'])
+def webhook():
+    """Handle incoming webhook from Telegram"""
+    try:
+        if not schedule_bot:
+            logger.error("Bot not initialized")
+            return 'Bot not ready', 503
+            
+        json_data = orjson.loads(request.get_data())
+        
+        if json_data:
+            # Group chats send every message; skip non-commands before queueing
+            message = json_data.get('message')
+            if message is not None and message.get('text', '')[:1] != '/':
+                return 'OK', 200
+            
+            update_executor.submit(process_update, json_data)
         
         return 'OK', 200
         
@@ -682,245 +1042,177 @@ def webhook():
         logger.error(f"Webhook error: {e}")
         return 'Error', 500
 
+def make_etag(data: bytes) -> str:
+    """Short content hash used as an ETag"""
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+def conditional_response(etag, cache_control, build):
+    """Answer 304 if the client already holds etag, otherwise the response from build()"""
+    # flask-compress tags compressed bodies as "<etag>:<algorithm>", so accept those too
+    if_none_match = request.if_none_match
+    held = next((tag for tag in (etag, *(f'{etag}:{algo}' for algo in COMPRESS_ALGORITHMS))
+                 if if_none_match.contains(tag)), None)
+    if held:
+        response = app.response_class(status=304)
+        response.set_etag(held)
+    else:
+        response = build()
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+# SCHEDULE never changes at runtime, so it is serialized (and hashed) once;
+# requests only encode the small per-minute fields and splice them in
+SCHEDULE_JSON = orjson.dumps(SCHEDULE)
+SCHEDULE_ETAG = make_etag(SCHEDULE_JSON)
+DAY_SCHEDULE_JSON = {day: orjson.dumps(SCHEDULE.get(day, [])) for day in WEEKDAYS}
+
+def status_page_line(pair, start_min, current_min, current_pair_time):
+    """HTML-safe '<state> time - subject' line for the status page"""
+    # Compare minute ints, not 'H:MM' strings ('8:30' > '10:30' as strings)
+    if pair['time'] == current_pair_time:
+        state = '🔴'
+    elif start_min > current_min:
+        state = '⏳'
+    else:
+        state = '✅'
+    return Markup('{} {} - {}').format(state, pair['time'], pair['subject'])
+
+# Time-derived values shared by the web endpoints: (minute, data), swapped atomically
+_minute_snapshot = (None, None)
+
+def minute_snapshot(current_time):
+    """Return the day/pair data for current_time's minute, rebuilding it when the minute changes"""
+    global _minute_snapshot
+    minute = current_time.replace(second=0, microsecond=0)
+    snapshot_minute, data = _minute_snapshot
+    if minute == snapshot_minute:
+        return data
+    
+    current_day = WEEKDAYS[current_time.weekday()]
+    current_min = current_time.hour * 60 + current_time.minute
+    current_pair = _current_pair_cached(current_day, current_min)
+    next_pair = _next_pair_cached(current_day, current_min)
+    current_pair_time = current_pair['time'] if current_pair else None
+    next_pair_time = next_pair['time'] if next_pair else None
+    
+    data = {
+        'minute': minute,
+        'day': current_day,
+        'day_ua': WEEKDAYS_UA.get(current_day, 'Невідомо'),
+        'current_min': current_min,
+        'current_pair': current_pair,
+        'next_pair': next_pair,
+        # Status page lines, rendered here so the template loop only emits them
+        'today_schedule': [
+            status_page_line(pair, start_min, current_min, current_pair_time)
+            for start_min, pair in zip(START_MIN.get(current_day, ()), SCHEDULE.get(current_day, ()))
+        ],
+        # The time-dependent JSON fields shared by /api/schedule and /api/now
+        'now_fields': b''.join((
+            b'"current_day":', orjson.dumps(current_day),
+            b',"current_pair":', orjson.dumps(current_pair),
+            b',"next_pair":', orjson.dumps(next_pair),
+            b',"today_schedule":', DAY_SCHEDULE_JSON[current_day]
+        )),
+        # Everything in /api/schedule except SCHEDULE is derived from the day and the two pairs
+        'schedule_etag': make_etag(orjson.dumps([SCHEDULE_ETAG, current_day, current_pair_time, next_pair_time]))
+    }
+    _minute_snapshot = (minute, data)
+    return data
+
+# Rendered status page (and its ETag) reused for a few seconds while its minute is unchanged
+STATUS_PAGE_TTL = 10  # seconds
+_status_page_cache = {'key': None, 'html': None, 'etag': None, 'ts': 0.0}
+_status_page_lock = threading.Lock()
+
 @app.route('/')
 def status():
     """Bot status page"""
     current_time = schedule_bot.get_current_time_ukraine()
-    uptime = current_time - bot_stats['start_time']
-    current_pair = schedule_bot.get_current_pair()
-    next_pair = schedule_bot.get_next_pair()
-    today_schedule = schedule_bot.get_today_schedule()
-    current_day = schedule_bot.get_current_day()
-    
-    status_html = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>E-24 Schedule Bot Status</title>
-        <meta charset="utf-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <style>
-            body { 
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; 
-                margin: 0; 
-                padding: 20px; 
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                min-height: 100vh;
-            }
-            .container { 
-                max-width: 800px; 
-                margin: 0 auto; 
-                background: white; 
-                padding: 30px; 
-                border-radius: 15px; 
-                box-shadow: 0 10px 30px rgba(0,0,0,0.2);
-            }
-            .header {
-                text-align: center;
-                margin-bottom: 30px;
-                padding-bottom: 20px;
-                border-bottom: 2px solid #f0f0f0;
-            }
-            .status { 
-                padding: 20px; 
-                border-radius: 10px; 
-                margin: 20px 0; 
-                border-left: 5px solid #28a745;
-            }
-            .online { 
-                background: #d4edda; 
-                border-color: #28a745; 
-                color: #155724; 
-            }
-            .current-pair {
-                background: #fff3cd;
-                border-left: 5px solid #ffc107;
-                color: #856404;
-                padding: 15px;
-                border-radius: 10px;
-                margin: 15px 0;
-            }
-            .next-pair {
-                background: #d1ecf1;
-                border-left: 5px solid #17a2b8;
-                color: #0c5460;
-                padding: 15px;
-                border-radius: 10px;
-                margin: 15px 0;
-            }
-            .stat { 
-                margin: 15px 0; 
-                padding: 15px; 
-                background: #f8f9fa; 
-                border-radius: 10px;
-                border-left: 4px solid #6c757d;
-            }
-            .schedule-today {
-                background: #e7f3ff;
-                border-left: 5px solid #007bff;
-                padding: 15px;
-                border-radius: 10px;
-                margin: 15px 0;
-            }
-            h1 { 
-                color: #333; 
-                margin: 0;
-                font-size: 2.2em;
-            }
-            h2 {
-                margin-top: 0;
-                font-size: 1.4em;
-            }
-            .emoji { 
-                font-size: 1.2em; 
-            }
-            .time-info {
-                font-size: 1.1em;
-                font-weight: bold;
-                color: #495057;
-            }
-            .pair-item {
-                margin: 8px 0;
-                padding: 8px;
-                background: rgba(255,255,255,0.7);
-                border-radius: 5px;
-            }
-        </style>
-        <script>
-            setTimeout(function(){ location.reload(); }, 30000);
-        </script>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>🎓 E-24 Schedule Bot</h1>
-                <p style="color: #666; margin: 10px 0;">Расписание группы E-24 • 2 курс • 1 семестр</p>
-            </div>
-            
-            <div class="status online">
-                <h2>🟢 Bot is Online</h2>
-                <p>Бот работает и готов помогать с расписанием!</p>
-            </div>
-
-            {% if current_pair %}
-            <div class="current-pair">
-                <h2>🔴 Сейчас идет пара:</h2>
-                <div class="time-info">{{ current_pair.time }} - {{ current_pair.subject }}</div>
-                <p>Пара #{{ current_pair.pair_number }}</p>
-            </div>
-            {% else %}
-            <div class="current-pair">
-                <h2>✅ Сейчас перерыв или выходной</h2>
-                <p>Текущее время: {{ current_time_str }}</p>
-            </div>
-            {% endif %}
-
-            {% if next_pair %}
-            <div class="next-pair">
-                <h2>⏭️ Следующая пара:</h2>
-                <div class="time-info">{{ next_pair.time }} - {{ next_pair.subject }}</div>
-                <p>Пара #{{ next_pair.pair_number }}</p>
-            </div>
-            {% endif %}
-
-            {% if today_schedule %}
-            <div class="schedule-today">
-                <h2>📅 Расписание на сегодня ({{ current_day_ua }}):</h2>
-                {% for pair in today_schedule %}
-                <div class="pair-item">
-                    {% if current_pair and pair.time == current_pair.time %}
-                        🔴 {{ pair.time }} - {{ pair.subject }}
-                    {% elif pair.time.split('-')[0] > current_time_str.split(':')[0] + ':' + current_time_str.split(':')[1] %}
-                        ⏳ {{ pair.time }} - {{ pair.subject }}
-                    {% else %}
-                        ✅ {{ pair.time }} - {{ pair.subject }}
-                    {% endif %}
-                </div>
-                {% endfor %}
-            </div>
-            {% else %}
-            <div class="schedule-today">
-                <h2>🎉 Сегодня ({{ current_day_ua }}) выходной день!</h2>
-            </div>
-            {% endif %}
-            
-            <div class="stat">
-                <strong>📊 Статистика:</strong><br>
-                🚀 Запущено: {{ start_time }}<br>
-                ⏱️ Время работы: {{ uptime }}<br>
-                💬 Обработано сообщений: {{ messages_processed }}<br>
-                👥 Активные чаты: {{ active_chats }}<br>
-                🕐 Последняя активность: {{ last_activity }}
-            </div>
-            
-            <div class="stat">
-                <strong>🇺🇦 Текущее время в Украине:</strong><br>
-                <span class="time-info">{{ current_time_full }}</span>
-            </div>
-            
-            <div class="stat">
-                <strong>📚 Доступные команды:</strong><br>
-                /start - Запустить бота<br>
-                /schedule - Полное расписание на неделю<br>
-                /current - Текущая пара<br>
-                /next - Следующая пара<br>
-                /today - Расписание на сегодня<br>
-                /help - Показать помощь
-            </div>
-            
-            <p style="text-align: center; color: #666; margin-top: 30px;">
-                Страница обновляется автоматически каждые 30 секунд
-            </p>
-        </div>
-    </body>
-    </html>
-    """
-    
-    return render_template_string(status_html,
-        start_time=bot_stats['start_time'].strftime('%Y-%m-%d %H:%M:%S'),
-        uptime=str(uptime).split('.')[0],
+    snap = minute_snapshot(current_time)
+    
+    with _status_page_lock:
+        now = time_module.monotonic()
+        if _status_page_cache['key'] is snap and now - _status_page_cache['ts'] < STATUS_PAGE_TTL:
+            html = _status_page_cache['html']
+            etag = _status_page_cache['etag']
+        else:
+            html = render_status_page(current_time, snap)
+            etag = make_etag(html.encode())
+            _status_page_cache.update(key=snap, html=html, etag=etag, ts=now)
+    
+    # The page reloads itself every 30 seconds; let browsers/proxies reuse it
+    # for that long and answer revalidations with 304 when nothing changed
+    return conditional_response(etag, 'public, max-age=30', lambda: make_response(html))
+
+def render_status_page(current_time, snap):
+    """Render status page HTML"""
+    # Clock values are shown to the snapshot's minute so re-renders within a
+    # minute are byte-identical and the page's 30 s reloads revalidate with 304
+    minute = snap['minute']
+    uptime = minute - bot_stats['start_time'].replace(second=0, microsecond=0)
+    current_time_full = format_timestamp(minute)[:16]
+    
+    return _get_template('status.html').render(
+        start_time=BOT_STATS_START_STR,
+        uptime=format_uptime(uptime)[:-3],
         messages_processed=bot_stats['messages_processed'],
-        active_chats=len(bot_stats['active_chats']),
-        last_activity=bot_stats['last_activity'].strftime('%Y-%m-%d %H:%M:%S'),
-        current_time_full=current_time.strftime('%Y-%m-%d %H:%M:%S'),
-        current_time_str=current_time.strftime('%H:%M'),
-        current_pair=current_pair,
-        next_pair=next_pair,
-        today_schedule=today_schedule,
-        current_day_ua=WEEKDAYS_UA.get(current_day, 'Невідомо')
+        active_chats=count_active_chats(current_time),
+        last_activity=bot_stats['last_activity_str'],
+        current_time_full=current_time_full,
+        current_time_str=current_time_full[11:],
+        current_pair=snap['current_pair'],
+        next_pair=snap['next_pair'],
+        today_schedule=snap['today_schedule'],
+        current_day_ua=snap['day_ua']
     )
 
 @app.route('/api/status')
 def api_status():
     """API endpoint for bot status"""
-    current_time = schedule_manager.get_current_time_ukraine()
+    current_time = schedule_bot.get_current_time_ukraine()
     uptime = current_time - bot_stats['start_time']
-    current_pair = schedule_manager.get_current_pair()
-    next_pair = schedule_manager.get_next_pair()
+    snap = minute_snapshot(current_time)
     
     return jsonify({
         'status': 'online',
-        'start_time': bot_stats['start_time'].isoformat(),
+        'start_time': bot_stats['start_time'],
         'uptime_seconds': int(uptime.total_seconds()),
         'messages_processed': bot_stats['messages_processed'],
-        'active_chats': len(bot_stats['active_chats']),
-        'last_activity': bot_stats['last_activity'].isoformat(),
-        'current_time': current_time.isoformat(),
-        'current_pair': current_pair,
-        'next_pair': next_pair,
-        'ukraine_time': current_time.strftime('%H:%M:%S')
+        'active_chats': count_active_chats(current_time),
+        'last_activity': bot_stats['last_activity'],
+        'current_time': current_time,
+        'current_pair': snap['current_pair'],
+        'next_pair': snap['next_pair'],
+        'ukraine_time': current_time.time().isoformat('seconds')
     })
 
 @app.route('/api/schedule')
 def api_schedule():
     """API endpoint for full schedule"""
-    return jsonify({
-        'schedule': SCHEDULE,
-        'current_day': schedule_bot.get_current_day(),
-        'current_pair': schedule_bot.get_current_pair(),
-        'next_pair': schedule_bot.get_next_pair(),
-        'today_schedule': schedule_bot.get_today_schedule()
-    })
+    snap = minute_snapshot(schedule_bot.get_current_time_ukraine())
+    return conditional_response(snap['schedule_etag'], 'public, max-age=10', lambda: app.response_class(
+        b''.join((b'{"schedule":', SCHEDULE_JSON, b',', snap['now_fields'], b'}')),
+        mimetype='application/json'
+    ))
+
+@app.route('/api/schedule/week')
+def api_schedule_week():
+    """API endpoint for the weekly schedule only; static, so clients can cache it for long"""
+    return conditional_response(SCHEDULE_ETAG, 'public, max-age=300', lambda: app.response_class(
+        SCHEDULE_JSON, mimetype='application/json'
+    ))
+
+@app.route('/api/now')
+def api_now():
+    """API endpoint for the time-dependent part of /api/schedule (day, current/next pair)"""
+    snap = minute_snapshot(schedule_bot.get_current_time_ukraine())
+    # Same inputs as /api/schedule's body minus the static SCHEDULE, so its ETag fits too
+    return conditional_response(snap['schedule_etag'], 'public, max-age=10', lambda: app.response_class(
+        b''.join((b'{', snap['now_fields'], b'}')),
+        mimetype='application/json'
+    ))
 
 @app.route('/health')
 def health_check():
@@ -928,7 +1220,7 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'bot_running': True,
-        'timestamp': datetime.now(moscow_tz).isoformat()
+        'timestamp': datetime.now(UKRAINE_TZ)
     }), 200
 
 @app.route('/favicon.ico')
@@ -945,18 +1237,7 @@ if __name__ == '__main__':
         print("❌ WEBHOOK_URL environment variable is required!")
         exit(1)
     
-    print(f"🚀 Starting E-24 Schedule Bot")
-    print(f"🤖 Bot token: {TOKEN[:10]}...")
-    
-    # Исправляем двойной слэш в webhook URL
-    webhook_base = WEBHOOK_URL.rstrip('/') if WEBHOOK_URL else ''
-    webhook_full = f"{webhook_base}/webhook"
-    print(f"📡 Webhook URL: {webhook_full}")
-    
-    # Initialize bot after environment variables are confirmed
-    print("🤖 Initializing bot...")
-    schedule_bot = ScheduleBot()
-    print("✅ Bot initialized successfully")
+    init_bot()
     
     # Railway использует переменную PORT
     port = int(os.getenv('PORT', 5000))
@@ -966,5 +1247,7 @@ if __name__ == '__main__':
     print(f"🔧 Railway PORT env: {os.getenv('PORT', 'Not set')}")
     print(f"🔧 WEBHOOK_URL env: {WEBHOOK_URL}")
     
-    # Запуск с threaded=True для Railway
-    app.run(host=host, port=port, debug=False, threaded=True)
+    # Direct runs (including Windows, where gunicorn is unavailable) use waitress;
+    # production runs under gunicorn (see gunicorn.conf.py)
+    from waitress import serve
+    serve(app, host=host, port=port, threads=8, channel_timeout=30)
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn configuration for E-24 Schedule Bot
+gevent workers: outbound Telegram API calls don't block other webhook requests
+"""
+
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Railway использует переменную PORT
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+
+# gevent patches sockets/threads before the app is imported in the worker.
+# A single worker keeps the in-memory bot_stats consistent; raise
+# WEB_CONCURRENCY only if per-process stats are acceptable.
+worker_class = 'gevent'
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+worker_connections = 500
+timeout = 60
+
+def on_starting(server):
+    """Refuse to start without bot configuration"""
+    for name in ('BOT_TOKEN', 'WEBHOOK_URL'):
+        if not os.getenv(name):
+            print(f"❌ {name} environment variable is required!")
+            sys.exit(1)
+
+def post_worker_init(worker):
+    """Initialize the bot inside each worker after the app is loaded"""
+    import flask_app
+    flask_app.init_bot()
@@ -42,15 +42,16 @@ BREAK_SCHEDULE = [
     {"time": "13:30-14:50", "break_after": "после занятий"}
 ]
 
-WEEKDAYS = {
-    0: "monday",
-    1: "tuesday", 
-    2: "wednesday",
-    3: "thursday",
-    4: "friday",
-    5: "saturday",
-    6: "sunday"
-}
+# Indexed by datetime.weekday() (0 = Monday)
+WEEKDAYS = (
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday"
+)
 
 WEEKDAYS_UA = {
     "monday": "Понедельник",
@@ -61,3 +62,30 @@ WEEKDAYS_UA = {
     "saturday": "Суббота",
     "sunday": "Воскресенье"
 }
+
+
+# Lookup tables derived from SCHEDULE once at import
+
+def parse_time(time_str: str) -> tuple:
+    """Parse time string like '8:30-9:50' to (start, end) minutes since midnight"""
+    start_str, end_str = time_str.split('-')
+    start_hour, start_min = start_str.split(':')
+    end_hour, end_min = end_str.split(':')
+    return int(start_hour) * 60 + int(start_min), int(end_hour) * 60 + int(end_min)
+
+# Display start/end strings per pair time ('8:30-9:50' -> ('8:30', '9:50')); kept
+# beside the pair dicts because those are serialized as-is by the JSON endpoints
+PAIR_TIME_STRS = {
+    pair['time']: tuple(pair['time'].split('-'))
+    for pairs in SCHEDULE.values()
+    for pair in pairs
+}
+
+# Pair start/end minutes of the day, index-aligned with SCHEDULE[day] (sorted,
+# for bisect lookups); a pair is running while start <= minute < end
+_PAIR_MINUTES = {
+    day: [parse_time(pair['time']) for pair in pairs]
+    for day, pairs in SCHEDULE.items()
+}
+START_MIN = {day: [start for start, _ in spans] for day, spans in _PAIR_MINUTES.items()}
+END_MIN = {day: [end for _, end in spans] for day, spans in _PAIR_MINUTES.items()}
@@ -12,5 +12,5 @@ echo "Initializing database..."
 python -c "from flask_app import init_db; init_db()"
 
 # Start the Flask application
-echo "Starting Flask application..."
-exec python flask_app.py
+echo "Starting gunicorn server..."
+exec gunicorn flask_app:app